@@ -1,13 +1,100 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from io import BytesIO
-from typing import List
+from typing import BinaryIO, List, Optional
+import img2pdf
+import pikepdf
 from PIL import Image
 from fpdf import FPDF
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from starlette.responses import StreamingResponse
+from starlette.responses import JSONResponse, Response
 from starlette.middleware.cors import CORSMiddleware # <--- NAYA IMPORT
 
+# Har uploaded file ki zyada se zyada size (bytes)
+MAX_FILE_SIZE = 50 * 1024 * 1024
+# Poori request (tamam files mila kar) ki zyada se zyada size (bytes)
+MAX_REQUEST_SIZE = 4 * MAX_FILE_SIZE
+
+
+async def run_in_convert_pool(fn, *args):
+    """
+    Blocking function ko app ke convert pool mein chala kar uska result await karta hai.
+    """
+    pool = app.state.convert_pool
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pillow apne format plugins pehli Image.open par import karta hai;
+    # startup par hi load kar len taake pehli request ye keemat na de.
+    Image.init()
+
+    # Conversion/merge ke liye alag, mehdood (bounded) pool taake ek waqt mein
+    # CPU cores se zyada conversions na chalen aur default pool khali rahe.
+    # Har lifespan apna pool banata hai, is liye restart ke baad bhi kaam karta hai.
+    pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="convert")
+    app.state.convert_pool = pool
+    try:
+        yield
+    finally:
+        # Shutdown par pool ko saaf tareeqe se band karen
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Bahut bari request ko upload ke dauran hi rad kar deta hai:
+    - Content-Length header ho to body read hone se pehle hi 413.
+    - Header na ho (chunked upload) to aate hue body chunks ginta hai aur
+      max_size paar hote hi 413 deta hai; baaqi body spool nahi hoti.
+    Pure ASGI middleware hai, is liye body stream par koi extra layer nahi lagti.
+    Note: ye poori request ki had hai. MAX_FILE_SIZE se bari magar
+    max_size se choti ek file poori upload hone ke baad hi rad hoti hai.
+    """
+
+    def __init__(self, app, max_size: int):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > self.max_size:
+                    response = JSONResponse(status_code=413, content={"detail": "Request body too large."})
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    # Body parsing ke beech HTTPException uthane par FastAPI
+                    # isay 413 response mein badal deta hai
+                    raise HTTPException(status_code=413, detail="Request body too large.")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
 # FastAPI application instance
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# CORS middleware neeche add hota hai aur isay wrap karta hai, is liye
+# 413 response par bhi CORS headers lagte hain.
+app.add_middleware(RequestSizeLimitMiddleware, max_size=MAX_REQUEST_SIZE)
+
 
 # ----------------------------------------------------
 # 🌟 FIX: CORS MIDDLEWARE (Domain Allow Karne Ke Liye) 
@@ -30,41 +117,78 @@ app.add_middleware(
 )
 # ----------------------------------------------------
 
-def image_to_pdf(image_data: BytesIO) -> bytes:
+# Ye formats img2pdf bina decode/re-encode ke seedha PDF mein embed kar leta hai
+IMG2PDF_FORMATS = frozenset({"JPEG", "PNG"})
+
+# File ke shuru ke magic bytes se format pehchanne ke liye
+IMAGE_SIGNATURES = {
+    b"\xff\xd8\xff": "JPEG",
+    b"\x89PNG\r\n\x1a\n": "PNG",
+}
+
+# 72 DPI par 1 pixel = 1 point; layout function ek hi baar banaen
+PIXEL_LAYOUT = img2pdf.get_fixed_dpi_layout_fun((72, 72))
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """
+    Header bytes se image format batata hai (sirf IMAGE_SIGNATURES wale formats).
+    """
+    for signature, image_format in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return image_format
+    return None
+
+
+def image_to_pdf(image_data: BinaryIO) -> bytes:
     """
-    In-memory image ko PDF bytes mein convert karta hai.
-    (Pehle ki AttributeError fix shamil hai)
+    Uploaded image stream ko PDF bytes mein convert karta hai.
+    JPEG/PNG img2pdf se, baaki formats FPDF se.
     """
     try:
+        # FAST PATH: JPEG/PNG ko magic bytes se pehchan kar img2pdf ko den.
+        # JPEG aur opaque PNG ka asal compressed stream seedha embed hota hai;
+        # transparent PNG ko img2pdf khud Pillow se decode karke /SMask banata hai.
+        header = image_data.read(16)
+        image_data.seek(0)
+        if sniff_image_format(header) in IMG2PDF_FORMATS:
+            try:
+                return img2pdf.convert(
+                    image_data.read(),
+                    layout_fun=PIXEL_LAYOUT,
+                )
+            except (img2pdf.AlphaChannelError, ValueError):
+                # img2pdf ye files reject karta hai, inhen FPDF par chalen:
+                # - ">8 bit multiple channels" wali PNG (maslan 16-bit RGBA)
+                # - page size 3..14400 PDF units se bahar (maslan 2x2 ya 14401x10)
+                image_data.seek(0)
+
         # Image ko PIL (Pillow) se open karen
         img = Image.open(image_data)
         
-        # Dimensions aur format hasil karen
-        w, h = img.size
-        image_format = img.format
-        
-        if not image_format:
+        if not img.format:
             raise ValueError("Image format could not be determined. Check if the file is a valid image.")
 
+        # Dimensions hasil karen (sirf header parse hota hai, pixels decode nahi hote)
+        w, h = img.size
+
         # FPDF object banaen
         pdf = FPDF(unit="pt", format=(w, h))
         pdf.add_page()
         
-        # BytesIO pointer ko shuruaat mein laayen
-        image_data.seek(0)
-        
-        # FIX: fpdf.image ko 'type' argument ke saath call karen
+        # Pehle se khuli PIL image seedha FPDF ko den; stream ko seek karke
+        # FPDF se dobara open/parse karwane ki zarurat nahi.
         pdf.image(
-            name=image_data, 
+            name=img, 
             x=0, 
             y=0, 
             w=w, 
             h=h, 
-            type=image_format # Ye wo FIX hai jo 'rfind' error ko dur karta hai
         )
 
         # PDF ko in-memory bytes mein output karen
-        pdf_bytes = pdf.output(dest='S').encode('latin1')
+        # (fpdf2 ka output() pehle se bytearray deta hai, encode ki zarurat nahi)
+        pdf_bytes = bytes(pdf.output())
         return pdf_bytes
 
     except ValueError as e:
@@ -74,6 +198,49 @@ def image_to_pdf(image_data: BytesIO) -> bytes:
         raise HTTPException(status_code=500, detail="Internal server error during PDF generation.")
 
 
+def merge_pdfs(pdf_parts: List[bytes]) -> BytesIO:
+    """
+    Kai PDF parts ko ek single PDF mein jorta hai.
+    pikepdf (QPDF) pages ko reference se copy karta hai, content streams dobara parse nahi hote.
+    """
+    merged = pikepdf.Pdf.new()
+    # Source PDFs ko save() tak khula rakhna zaruri hai
+    sources = []
+    try:
+        for part in pdf_parts:
+            src = pikepdf.Pdf.open(BytesIO(part))
+            sources.append(src)
+            merged.pages.extend(src.pages)
+
+        # getvalue() poore PDF ki copy banata hai; buffer hi wapas karen
+        out = BytesIO()
+        merged.save(out)
+        out.seek(0)
+        return out
+    finally:
+        for src in sources:
+            src.close()
+        merged.close()
+
+
+async def convert_upload(file: UploadFile) -> bytes:
+    """
+    Ek UploadFile ko convert pool mein PDF bytes mein convert karta hai.
+    """
+    # UploadFile ka spooled file seedha istemal karen; poori file ko
+    # read() karke dobara BytesIO mein copy karne ki zarurat nahi.
+    data = file.file
+    data.seek(0)
+
+    try:
+        # CPU-bound conversion ko convert pool mein chalayen taake event loop block na ho
+        return await run_in_convert_pool(image_to_pdf, data)
+    except HTTPException as e:
+        raise e
+    except Exception:
+        raise HTTPException(status_code=500, detail=f"Failed to process file: {file.filename}")
+
+
 @app.post("/convert/to-pdf", summary="Convert images to a single PDF")
 async def convert_to_pdf(files: List[UploadFile] = File(...)):
     """
@@ -82,30 +249,43 @@ async def convert_to_pdf(files: List[UploadFile] = File(...)):
     if not files:
         raise HTTPException(status_code=400, detail="No files uploaded.")
         
-    pdf_parts = []
-    
     for file in files:
-        content = await file.read()
-        data = BytesIO(content)
-        
-        try:
-            pdf_part = image_to_pdf(data)
-            pdf_parts.append(pdf_part)
-        except HTTPException as e:
-            raise e
-        except Exception:
-            raise HTTPException(status_code=500, detail=f"Failed to process file: {file.filename}")
-
-    # Agar multiple parts hain, to sabse pehle ka PDF return karen (Merging logic ki zarurat ho sakti hai)
-    if pdf_parts:
-        final_pdf_bytes = pdf_parts[0]
+        # Size multipart parsing ke waqt hi maloom ho jati hai; file read kiye baghair check karen
+        if file.size is not None and file.size > MAX_FILE_SIZE:
+            raise HTTPException(status_code=413, detail=f"File too large: {file.filename}")
+
+    # Har file alag se convert hoti hai, is liye sab ko ek saath chalayen.
+    # gather() results ko upload ki tarteeb mein hi wapas karta hai.
+    tasks = [asyncio.create_task(convert_upload(file)) for file in files]
+    try:
+        pdf_parts = await asyncio.gather(*tasks)
+    except BaseException:
+        # Pehli naakaami par baaki tasks cancel karen, taake pool mein line
+        # mein lagi conversions shuru hi na hon. Client ko pehli naakaam file
+        # ka HTTPException hi jata hai.
+        for task in tasks:
+            task.cancel()
+        raise
+
+    # Sirf ek file ho to merge ki zarurat nahi, wahi PDF wapas bhej den
+    if len(pdf_parts) == 1:
+        final_pdf = pdf_parts[0]
     else:
-         raise HTTPException(status_code=500, detail="No PDF parts were created.")
+        # Tamam parts ko ek PDF mein merge karen
+        try:
+            merged = await run_in_convert_pool(merge_pdfs, pdf_parts)
+        except Exception as e:
+            print(f"Error during PDF merge: {e}")
+            raise HTTPException(status_code=500, detail="Internal server error while merging PDFs.")
+        # getbuffer() buffer ki copy nahi banata
+        final_pdf = merged.getbuffer()
 
 
-    # Result ko StreamingResponse ke taur par return karen
-    return StreamingResponse(
-        BytesIO(final_pdf_bytes),
+    # PDF pehle se memory mein hai, isay ek hi body mein bhej den.
+    # StreamingResponse BytesIO ko line-by-line (har b"\n" par) threadpool se
+    # iterate karta tha; Response Content-Length ke saath seedha bhejta hai.
+    return Response(
+        final_pdf,
         media_type="application/pdf",
         headers={"Content-Disposition": "attachment; filename=converted.pdf"}
     )